@@ -2,6 +2,7 @@ import logging
 import asyncio
 from openai import AsyncOpenAI, OpenAI
 from server.assistant import OpenAIAssistant
+from server.context import ContextPolicy
 from server.utils import create_assistant, create_thread, delete_thread, chat_with_assistant
 
 
@@ -22,6 +23,8 @@ async def main():
     assistant = await create_assistant(assistant_instance)
     # 创建 thread 实例
     thread = await create_thread(client=client)
+    # 当前会话的上下文预算：保留最近 10 条消息，并限制每轮的 prompt 与生成长度
+    context_policy = ContextPolicy(last_messages=10, max_prompt_tokens=20000, max_completion_tokens=4000)
 
     while True:
         try:
@@ -30,14 +33,15 @@ async def main():
                 break
 
             # 实现对话的主函数
-            async for token in chat_with_assistant(assistant=assistant, thread=thread, user_query=query, client=client):
+            async for token in chat_with_assistant(assistant=assistant, thread=thread, user_query=query, client=client,
+                                                 context_policy=context_policy):
                 print(token, end='')
 
         except Exception:
             logger.exception("error in chat: ")
 
     # 删除线程
-    delete_thread(thread_id=thread.id, sync_client=sync_client)
+    delete_thread(thread_id=thread.id, sync_client=sync_client, context_policy=context_policy)
 
 
 if __name__ == '__main__':
@@ -10,6 +10,41 @@ class OpenAIAssistant:
     def __init__(self, client):
         self.client = client
         self.assistant_id = None
+        # 批处理状态下暂存的 assistants.update 参数；为 None 表示未处于批处理状态
+        self._pending_update = None
+
+    def start_update_batch(self):
+        # 开始批处理：之后的更新请求只合并参数，直到 flush_update_batch 时一次性提交
+        if self._pending_update is None:
+            self._pending_update = {}
+
+    async def flush_update_batch(self):
+        # 提交合并后的更新，并结束批处理
+        try:
+            await self._send_pending_update()
+        finally:
+            self._pending_update = None
+
+    async def _send_pending_update(self):
+        if self._pending_update:
+            pending, self._pending_update = self._pending_update, {}
+            self.assistant = await self.client.beta.assistants.update(
+                assistant_id=self.assistant_id,
+                **pending
+            )
+
+    async def _update(self, **kwargs):
+        if self._pending_update is None:
+            self.assistant = await self.client.beta.assistants.update(
+                assistant_id=self.assistant_id,
+                **kwargs
+            )
+            return
+
+        # 同一字段被设置为不同的值时无法合并，先提交已暂存的更新，保证更新顺序
+        if any(key in self._pending_update and self._pending_update[key] != value for key, value in kwargs.items()):
+            await self._send_pending_update()
+        self._pending_update.update(kwargs)
 
     async def get_or_create_assistant(self, name, model):
         try:
@@ -29,10 +64,7 @@ class OpenAIAssistant:
 
     async def set_description_and_instructions(self, instructions):
         # 更新助理的指令
-        self.assistant = await self.client.beta.assistants.update(
-            assistant_id=self.assistant_id,
-            instructions=instructions
-        )
+        await self._update(instructions=instructions)
         return self
 
     async def set_tools(self, tools):
@@ -45,17 +77,13 @@ class OpenAIAssistant:
         # 根据条件添加 tool_resources
         if contains_file_search:
             # 如果存在 {"type": "file_search"}，添加 tool_resources 参数
-            await self.client.beta.assistants.update(
-                assistant_id=self.assistant_id,
+            await self._update(
                 tools=tools,
                 tool_resources={"file_search": {"vector_store_ids": [vector_store_id]}}
             )
         else:
             # 如果不存在，只更新 tools 参数
-            await self.client.beta.assistants.update(
-                assistant_id=self.assistant_id,
-                tools=tools
-            )
+            await self._update(tools=tools)
 
         return self
 
@@ -0,0 +1,123 @@
+import logging
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Deque, Dict, Optional
+
+# 配置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ThreadUsage:
+    """单个 thread 的 token 用量统计。最近若干轮的用量保存在 history 中，用于观察每轮上下文的增长。"""
+    runs: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    total_tokens: int = 0
+    history: Deque[Dict[str, int]] = field(default_factory=lambda: deque(maxlen=50))
+
+    def add(self, usage):
+        self.runs += 1
+        self.prompt_tokens += usage.prompt_tokens
+        self.completion_tokens += usage.completion_tokens
+        self.total_tokens += usage.total_tokens
+        self.history.append({"prompt_tokens": usage.prompt_tokens,
+                             "completion_tokens": usage.completion_tokens,
+                             "total_tokens": usage.total_tokens})
+
+
+class ContextPolicy:
+    """
+    会话级的上下文预算策略，为每次 runs.create 生成 truncation_strategy、max_prompt_tokens 和 max_completion_tokens，
+    并根据 ThreadRunCompleted 上报的 usage 自适应调整每个 thread 保留的消息条数，使每轮的上下文规模保持稳定。
+    """
+
+    def __init__(self, last_messages: Optional[int] = 10, max_prompt_tokens: Optional[int] = None,
+                 max_completion_tokens: Optional[int] = None, min_messages: int = 2,
+                 shrink_ratio: float = 0.9, grow_ratio: float = 0.5):
+        """
+        :param last_messages: 每次运行最多保留的最近消息条数，None 表示交给服务端自动截断。
+        :param max_prompt_tokens: 单次运行 prompt 的 token 上限（OpenAI 要求不少于 256）。
+        :param max_completion_tokens: 单次运行生成的 token 上限（OpenAI 要求不少于 256）。
+        :param min_messages: 自适应收缩时保留的最少消息条数。
+        :param shrink_ratio: prompt 用量超过 max_prompt_tokens 的该比例时，减少保留的消息条数。
+        :param grow_ratio: prompt 用量低于 max_prompt_tokens 的该比例时，逐步恢复保留的消息条数。
+        """
+        if last_messages is not None and last_messages < 1:
+            raise ValueError("last_messages must be at least 1")
+        if min_messages < 1:
+            raise ValueError("min_messages must be at least 1")
+        if not 0 < grow_ratio < shrink_ratio:
+            raise ValueError("grow_ratio must be greater than 0 and less than shrink_ratio")
+        for name, value in (("max_prompt_tokens", max_prompt_tokens), ("max_completion_tokens", max_completion_tokens)):
+            if value is not None and value < 256:
+                raise ValueError(f"{name} must be at least 256")
+
+        self.last_messages = last_messages
+        self.max_prompt_tokens = max_prompt_tokens
+        self.max_completion_tokens = max_completion_tokens
+        self.min_messages = min(min_messages, last_messages) if last_messages is not None else min_messages
+        self.shrink_ratio = shrink_ratio
+        self.grow_ratio = grow_ratio
+        # 每个 thread 当前生效的消息窗口大小，以及 token 用量统计
+        self._windows: Dict[str, int] = {}
+        self.usage: Dict[str, ThreadUsage] = {}
+
+    def window_for(self, thread_id: str) -> Optional[int]:
+        """返回该 thread 当前保留的最近消息条数。"""
+        if self.last_messages is None:
+            return None
+        return self._windows.get(thread_id, self.last_messages)
+
+    def run_params(self, thread_id: str) -> dict:
+        """
+        生成传给 runs.create 的上下文控制参数。
+
+        :param thread_id: 运行所在的 thread id。
+        :return: 可直接展开到 runs.create 的关键字参数。
+        """
+        params = {}
+        window = self.window_for(thread_id)
+        if window is None:
+            params["truncation_strategy"] = {"type": "auto"}
+        else:
+            params["truncation_strategy"] = {"type": "last_messages", "last_messages": window}
+        if self.max_prompt_tokens is not None:
+            params["max_prompt_tokens"] = self.max_prompt_tokens
+        if self.max_completion_tokens is not None:
+            params["max_completion_tokens"] = self.max_completion_tokens
+        return params
+
+    def record_usage(self, thread_id: str, usage) -> None:
+        """
+        记录一次运行的 usage，并据此调整该 thread 的消息窗口：
+        prompt 接近预算时按 1/4 收缩，明显低于预算时每轮恢复一条，直到回到配置的 last_messages。
+
+        :param thread_id: 运行所在的 thread id。
+        :param usage: Run.usage 对象，包含 prompt_tokens、completion_tokens、total_tokens。
+        """
+        if usage is None:
+            return
+        self.usage.setdefault(thread_id, ThreadUsage()).add(usage)
+
+        window = self.window_for(thread_id)
+        if window is None or self.max_prompt_tokens is None:
+            return
+
+        ratio = usage.prompt_tokens / self.max_prompt_tokens
+        if ratio > self.shrink_ratio and window > self.min_messages:
+            new_window = max(self.min_messages, window - max(1, window // 4))
+        elif ratio < self.grow_ratio and window < self.last_messages:
+            new_window = window + 1
+        else:
+            return
+
+        self._windows[thread_id] = new_window
+        logger.info(f"thread {thread_id} used {usage.prompt_tokens}/{self.max_prompt_tokens} prompt tokens, "
+                    f"last_messages window changed from {window} to {new_window}")
+
+    def forget(self, thread_id: str) -> None:
+        """删除 thread 时清理对应的状态，避免长时间运行时状态不断增长。"""
+        self._windows.pop(thread_id, None)
+        self.usage.pop(thread_id, None)
@@ -1,20 +1,41 @@
+import asyncio
+import logging
+import time
 from types import NoneType
 from typing import Type, get_origin, get_args, Union, Any
 
+# 配置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
 
 class AsyncChain:
     """
     AsyncChain 类的目的是允许对一个对象进行一系列的异步操作，并按顺序执行这些操作。
+
+    默认情况下每一步都依赖之前所有尚未被依赖的步骤，按顺序执行；也可以通过 parallel() / sequential() 声明并行组，
+    或通过 after() 为下一步显式声明依赖，相互独立的步骤会并发执行。
+    只有不会与任何其他步骤并发执行的步骤，其返回值才会替换当前对象；可能与其他步骤并发执行的步骤必须返回当前对象本身，
+    否则在 execute 时抛出 TypeError，以免各步骤竞争替换对象。
+    注意：parallel、sequential、after、execute 这几个名称由 AsyncChain 自身占用，不会转发到目标对象。
     """
 
-    def __init__(self, obj):
+    def __init__(self, obj, merge_updates=False):
         """
         初始化 AsyncChain，设置目标对象，方法将在此对象上被调用。
 
         :param obj: 方法将被调用的对象。
+        :param merge_updates: 为 True 且目标对象支持 start_update_batch / flush_update_batch 时，
+                              链中的更新请求会被合并，在执行结束时一次性提交。
         """
         self._obj = obj  # obj 是任何一个 Python 对象
-        self._calls = []  # 初始化函数将传入的对象保存在 self._obj 中，并初始化一个空列表 self._calls，用于存储所有待执行的异步方法调用。
+        self._calls = []  # 存储所有待执行的步骤，每一项为 (步骤名, 依赖的步骤名列表, 方法名, 位置参数, 关键字参数)
+        self._merge_updates = merge_updates
+        self._parallel = False  # 当前是否处于并行组中
+        self._group_deps = []  # 当前并行组中每一步共同依赖的步骤
+        self._leaves = []  # 尚未被任何步骤依赖的步骤，下一个顺序步骤需要等待它们全部完成
+        self._next_deps = None  # 通过 after() 为下一步显式声明的依赖
+        self.timings = {}  # 每一步的耗时（秒），在 execute 之后可用
 
     def __getattr__(self, name):
         """
@@ -27,25 +48,121 @@ class AsyncChain:
         """
 
         def method(*args, **kwargs):
-            async def async_call():
-                # 它从 _obj 中获取真正要调用的方法，并在适当的时候（即 execute 被调用时）执行这个方法。
-                func = getattr(self._obj, name)
-                self._obj = await func(*args, **kwargs)
+            # 同名方法多次调用时，用序号区分步骤名，例如 set_tools、set_tools#2
+            step_name = name
+            existing_names = {call_name for call_name, *_ in self._calls}
+            index = 2
+            while step_name in existing_names:
+                step_name = f"{name}#{index}"
+                index += 1
+
+            if self._next_deps is not None:
+                deps = self._next_deps
+                self._next_deps = None
+            elif self._parallel:
+                deps = list(self._group_deps)
+            else:
+                deps = list(self._leaves)
 
-            # 通过将 async_call 添加到 _calls 列表，实际上是在排队等待这个调用的执行。
-            self._calls.append(async_call)
+            # 通过将调用添加到 _calls 列表，实际上是在排队等待这个调用的执行。
+            self._calls.append((step_name, deps, name, args, kwargs))
+            self._leaves = [leaf for leaf in self._leaves if leaf not in deps] + [step_name]
             return self
 
         return method
 
-    async def execute(self):
+    def parallel(self):
+        """
+        开始一个并行组：之后添加的步骤只依赖并行组之前的步骤，彼此之间并发执行，直到调用 sequential()。
+
+        :return: 当前 AsyncChain，便于链式调用。
         """
-        execute 方法是一个异步方法，它按照 self._calls 列表中的顺序依次执行所有的异步方法调用。
+        if not self._parallel:
+            self._group_deps = list(self._leaves)
+            self._parallel = True
+        return self
 
-        按添加的顺序执行所有链式的异步方法调用。
+    def sequential(self):
+        """
+        结束并行组：之后添加的步骤会等待并行组中的所有步骤（以及其他尚未被依赖的步骤）完成。
+
+        :return: 当前 AsyncChain，便于链式调用。
+        """
+        self._parallel = False
+        return self
+
+    def after(self, *step_names):
+        """
+        为下一个添加的步骤显式声明依赖，覆盖默认的顺序 / 并行组依赖。
+
+        :param step_names: 所依赖步骤的名称（即方法名，同名多次调用时为 name#2、name#3 ...），必须是已添加的步骤。
+        :return: 当前 AsyncChain，便于链式调用。
+        """
+        existing_names = {call_name for call_name, *_ in self._calls}
+        unknown = [step_name for step_name in step_names if step_name not in existing_names]
+        if unknown:
+            raise ValueError(f"unknown steps in chain: {unknown}")
+        self._next_deps = list(step_names)
+        return self
+
+    async def execute(self):
+        """
+        execute 方法是一个异步方法，它按照声明的依赖关系执行所有的异步方法调用：
+        依赖满足的步骤立即开始，相互独立的步骤并发执行，并记录每一步的耗时。
 
         :return: 经过所有链式调用修改后的对象。
         """
-        for call in self._calls:
-            await call()
-        return self._obj
\ No newline at end of file
+        batch_obj = self._obj if self._merge_updates and hasattr(self._obj, "start_update_batch") else None
+        if batch_obj is not None:
+            batch_obj.start_update_batch()
+
+        # 计算每一步的全部祖先；与某个步骤既不是祖先也不是后代关系的步骤可能与它并发执行
+        ancestors = {}
+        for step_name, deps, *_ in self._calls:
+            ancestors[step_name] = set(deps).union(*(ancestors[dep] for dep in deps))
+        exclusive = {
+            step_name: all(other == step_name or other in ancestors[step_name] or step_name in ancestors[other]
+                           for other in ancestors)
+            for step_name in ancestors
+        }
+
+        tasks = {}
+
+        async def call(step_name, name, args, kwargs):
+            # 它从 _obj 中获取真正要调用的方法，并在适当的时候（即 execute 被调用时）执行这个方法。
+            obj = self._obj
+            result = await getattr(obj, name)(*args, **kwargs)
+            if exclusive[step_name]:
+                self._obj = result
+            elif result is not obj:
+                raise TypeError(f"concurrent chain step {step_name} must return the object it was called on, "
+                                f"got {type(result).__name__}")
+
+        async def run_step(step_name, deps, name, args, kwargs):
+            if deps:
+                await asyncio.gather(*(tasks[dep] for dep in deps))
+            start = time.perf_counter()
+            await call(step_name, name, args, kwargs)
+            self.timings[step_name] = time.perf_counter() - start
+            logger.info(f"chain step {step_name} finished in {self.timings[step_name]:.3f}s")
+
+        # 依赖只能指向之前添加的步骤，因此按添加顺序创建任务即可保证不存在环
+        for step_name, deps, name, args, kwargs in self._calls:
+            tasks[step_name] = asyncio.create_task(run_step(step_name, deps, name, args, kwargs))
+
+        try:
+            await asyncio.gather(*tasks.values())
+        except BaseException:
+            # 任一步骤失败时取消其余步骤，并等待它们结束，避免遗留未回收的任务
+            for task in tasks.values():
+                task.cancel()
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+            raise
+        finally:
+            # 无论成功与否都结束批处理，提交已经合并的更新，避免目标对象一直停留在批处理状态
+            if batch_obj is not None:
+                start = time.perf_counter()
+                await batch_obj.flush_update_batch()
+                self.timings["flush_update_batch"] = time.perf_counter() - start
+
+        return self._obj
@@ -3,7 +3,8 @@ from openai.types.beta.threads import Run, RequiredActionFunctionToolCall
 from openai.types.beta.assistant_stream_event import (
     ThreadRunRequiresAction, ThreadMessageDelta, ThreadRunCompleted,
     ThreadRunFailed, ThreadRunCancelling, ThreadRunCancelled, ThreadRunExpired, ThreadRunStepFailed,
-    ThreadRunStepCancelled)
+    ThreadRunStepCancelled, ThreadRunIncomplete)
+from server.context import ContextPolicy
 from server.run import AsyncChain
 from tools.python_inter import PythonInterpreterTool
 from tools.utils import generate_openai_function_spec
@@ -12,7 +13,7 @@ import logging
 
 import asyncio
 import json
-from typing import Dict
+from typing import Dict, Optional
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
@@ -28,8 +29,8 @@ async def create_assistant(assistant_instant) -> Assistant:
     assistant_model = "gpt-4o"
     assistant_instructions = "You're a senior data analyst. When asked for data information, write and run Python code to answer the question"
 
-    # 构造一个链路，用于管理同一个对象上异步的链式调用方法
-    chain = AsyncChain(assistant_instant)
+    # 构造一个链路，用于管理同一个对象上异步的链式调用方法，并合并对 assistant 的多次更新请求
+    chain = AsyncChain(assistant_instant, merge_updates=True)
 
     # 这里定义内置的工具，file_search 或者 code interpreter
     default_tools = [
@@ -45,13 +46,16 @@ async def create_assistant(assistant_instant) -> Assistant:
 
     default_tools.extend(tools_spec)
 
-    # 执行异步链顺序调用
+    # 执行异步链：先获取或创建 assistant，再并行设置指令和工具（两次更新会合并为一次请求）
     openai_assistant_instance = await (
         chain.get_or_create_assistant(name=assistant_name, model=assistant_model)
+        .parallel()
         .set_description_and_instructions(instructions=assistant_instructions)
         .set_tools(default_tools)
+        .sequential()
         .execute()
     )
+    logger.info(f"assistant provisioning step timings: {chain.timings}")
 
     openai_assistant = openai_assistant_instance.assistant
     logger.info(f"created assistant {openai_assistant.name} with id: {openai_assistant.id}")
@@ -64,9 +68,11 @@ async def create_thread(client) -> Thread:
     return thread
 
 
-def delete_thread(thread_id, sync_client):
+def delete_thread(thread_id, sync_client, context_policy: Optional[ContextPolicy] = None):
     thread_deleted = sync_client.beta.threads.delete(thread_id=thread_id)
     logger.info(f"deleted thread {thread_id}: {thread_deleted.deleted}")
+    if context_policy is not None:
+        context_policy.forget(thread_id)
 
 
 async def kill_if_thread_is_running(thread_id: str, client):
@@ -222,27 +228,42 @@ async def process_event(event, thread: Thread, client, **kwargs):
 
     elif isinstance(event, ThreadRunCompleted):
         print("\nRun completed")
+        # 记录本轮的 token 用量，供上下文策略调整下一轮保留的消息条数
+        context_policy = kwargs.get("context_policy")
+        if context_policy is not None:
+            context_policy.record_usage(thread.id, event.data.usage)
+
+    elif isinstance(event, ThreadRunIncomplete):
+        # 达到 max_prompt_tokens / max_completion_tokens 时运行会以 incomplete 结束，已生成的内容仍然有效
+        logger.warning(f"run {event.data.id} incomplete: {event.data.incomplete_details}")
+        context_policy = kwargs.get("context_policy")
+        if context_policy is not None:
+            context_policy.record_usage(thread.id, event.data.usage)
 
     else:
         pass
         # print("\nRun in progress")
 
 
-async def chat_with_assistant(assistant: Assistant, thread: Thread, user_query: str, client, **kwargs):
+async def chat_with_assistant(assistant: Assistant, thread: Thread, user_query: str, client,
+                              context_policy: Optional[ContextPolicy] = None, **kwargs):
     # 需要先清除正在运行的thread
     await kill_if_thread_is_running(thread_id=thread.id, client=client)
     # 创建新一轮的消息到线程中
     message = await client.beta.threads.messages.create(thread_id=thread.id, role="user", content=user_query)
     logger.info(f"created message: {message}")
 
+    # 按会话的上下文策略限制本轮发送的上下文和生成长度
+    run_params = context_policy.run_params(thread.id) if context_policy is not None else {}
     stream = await client.beta.threads.runs.create(
         thread_id=thread.id,
         assistant_id=assistant.id,
-        stream=True
+        stream=True,
+        **run_params
     )
 
     async for event in stream:
-        async for token in process_event(event, thread, client=client, **kwargs):
+        async for token in process_event(event, thread, client=client, context_policy=context_policy, **kwargs):
             yield token
 
 
@@ -0,0 +1,387 @@
+import argparse
+import asyncio
+import gc
+import json
+import logging
+import os
+import random
+import resource
+import sys
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import redirect_stdout
+from types import SimpleNamespace
+
+from openai.types.beta import Assistant, Thread
+from openai.types.beta.assistant_stream_event import (
+    ThreadMessageDelta, ThreadRunRequiresAction, ThreadRunCompleted, ThreadRunFailed)
+from openai.types.beta.threads import Run, MessageDeltaEvent, MessageDelta, TextDeltaBlock, TextDelta
+from openai.types.beta.threads.run import RequiredAction, RequiredActionSubmitToolOutputs, Usage
+from openai.types.beta.threads.required_action_function_tool_call import RequiredActionFunctionToolCall, Function
+
+import server.utils
+from server.assistant import OpenAIAssistant
+from server.context import ContextPolicy
+from server.utils import create_assistant, create_thread, delete_thread, chat_with_assistant
+
+# 压测时只保留警告以上的日志，避免上千次对话刷屏
+logging.getLogger().setLevel(logging.WARNING)
+
+FAULTS = ["disconnect", "slow_consumer", "tool_timeout", "run_failure"]
+
+
+class FakeEventStream:
+    """
+    模拟 openai 的 AsyncStream：按顺序产出预先构造的事件，事件耗尽或调用 close() 时视为已关闭。
+    未关闭且仍被引用的流保留在 client.live_streams 中；未关闭就被垃圾回收的流计入 client.unclosed_streams，
+    用于发现客户端断开、超时或运行失败后没有被关闭的生成器链。
+    """
+
+    def __init__(self, events, client, token_delay):
+        self._events = iter(events)
+        self._client = client
+        self._token_delay = token_delay
+        client.live_streams.add(self)
+        # 回调不能引用 self，否则流永远不会被回收
+        self._finalizer = weakref.finalize(self, client.count_unclosed_stream)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        await asyncio.sleep(self._token_delay)
+        try:
+            return next(self._events)
+        except StopIteration:
+            self.close()
+            raise StopAsyncIteration
+
+    def close(self):
+        self._finalizer.detach()
+        self._client.live_streams.discard(self)
+
+
+class FakeClient:
+    """
+    本地的假 OpenAI 客户端，实现 server.utils 中用到的 assistants / threads / messages / runs 接口。
+    每个 thread 的事件脚本由 scenarios[thread_id] 指定，内容为 (首轮事件, 提交工具结果后的事件)。
+    """
+
+    def __init__(self, token_delay=0.0):
+        self.scenarios = {}
+        self.live_streams = weakref.WeakSet()
+        self.unclosed_streams = 0
+        self._token_delay = token_delay
+        self._counter = 0
+        self.beta = SimpleNamespace(
+            assistants=SimpleNamespace(create=self._create_assistant, update=self._update_assistant,
+                                       retrieve=self._retrieve_assistant),
+            threads=SimpleNamespace(
+                create=self._create_thread, delete=self._delete_thread,
+                messages=SimpleNamespace(create=self._create_message),
+                runs=SimpleNamespace(list=self._list_runs, retrieve=None, cancel=None,
+                                     create=self._create_run, submit_tool_outputs=self._submit_tool_outputs),
+            ),
+        )
+
+    def count_unclosed_stream(self):
+        self.unclosed_streams += 1
+
+    def _next_id(self, prefix):
+        self._counter += 1
+        return f"{prefix}_{self._counter}"
+
+    async def _create_assistant(self, name, model, **kwargs):
+        return Assistant.model_construct(id=self._next_id("asst"), name=name, model=model, **kwargs)
+
+    async def _update_assistant(self, assistant_id, **kwargs):
+        return Assistant.model_construct(id=assistant_id, name="Data Engineer", **kwargs)
+
+    async def _retrieve_assistant(self, **kwargs):
+        raise Exception("assistant not found")
+
+    async def _create_thread(self):
+        return Thread.model_construct(id=self._next_id("thread"))
+
+    def _delete_thread(self, thread_id):
+        return SimpleNamespace(id=thread_id, deleted=True)
+
+    async def _create_message(self, thread_id, role, content):
+        return SimpleNamespace(id=self._next_id("msg"), thread_id=thread_id, role=role, content=content)
+
+    async def _list_runs(self, thread_id):
+        # 模拟的 thread 上不会有遗留的运行
+        return
+        yield
+
+    async def _create_run(self, thread_id, assistant_id, stream, **kwargs):
+        first_events, _ = self.scenarios[thread_id]
+        return FakeEventStream(first_events, self, self._token_delay)
+
+    async def _submit_tool_outputs(self, thread_id, run_id, tool_outputs, stream):
+        _, tool_events = self.scenarios[thread_id]
+        return FakeEventStream(tool_events, self, self._token_delay)
+
+
+def text_events(n_tokens):
+    return [ThreadMessageDelta.model_construct(
+        event="thread.message.delta",
+        data=MessageDeltaEvent.model_construct(
+            id="msg", object="thread.message.delta",
+            delta=MessageDelta.model_construct(content=[TextDeltaBlock.model_construct(
+                index=0, type="text", text=TextDelta.model_construct(value=f"token{i} "))])))
+        for i in range(n_tokens)]
+
+
+def completed_event(thread_id, prompt_tokens):
+    usage = Usage.model_construct(prompt_tokens=prompt_tokens, completion_tokens=50, total_tokens=prompt_tokens + 50)
+    return ThreadRunCompleted.model_construct(
+        event="thread.run.completed",
+        data=Run.model_construct(id="run", thread_id=thread_id, status="completed", usage=usage))
+
+
+def requires_action_event(thread_id, py_code):
+    tool_call = RequiredActionFunctionToolCall.model_construct(
+        id="call", type="function",
+        function=Function.model_construct(name="PythonInterpreterTool", arguments=json.dumps({"py_code": py_code})))
+    required_action = RequiredAction.model_construct(
+        type="submit_tool_outputs",
+        submit_tool_outputs=RequiredActionSubmitToolOutputs.model_construct(tool_calls=[tool_call]))
+    return ThreadRunRequiresAction.model_construct(
+        event="thread.run.requires_action",
+        data=Run.model_construct(id="run", thread_id=thread_id, status="requires_action",
+                                 required_action=required_action))
+
+
+def failed_event(thread_id):
+    return ThreadRunFailed.model_construct(
+        event="thread.run.failed",
+        data=Run.model_construct(id="run", thread_id=thread_id, status="failed"))
+
+
+def build_scenario(thread_id, fault, args, rng):
+    """
+    根据注入的故障类型构造事件脚本。
+
+    :return: (首轮事件, 提交工具结果后的事件)
+    """
+    tokens = text_events(args.tokens)
+    prompt_tokens = rng.randint(500, 5000)
+
+    if fault == "run_failure":
+        return tokens[:args.tokens // 2] + [failed_event(thread_id)], []
+
+    if fault == "tool_timeout":
+        # 工具执行时间超过单次对话的超时时间，exec 所在的执行器线程会在对话取消后继续运行
+        py_code = f"__import__('time').sleep({args.timeout * 2})"
+        return [requires_action_event(thread_id, py_code)], tokens + [completed_event(thread_id, prompt_tokens)]
+
+    if rng.random() < args.tool_rate:
+        py_code = "list(range(1000))"
+        return [requires_action_event(thread_id, py_code)], tokens + [completed_event(thread_id, prompt_tokens)]
+
+    return tokens + [completed_event(thread_id, prompt_tokens)], []
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def rss_bytes():
+    """
+    返回 (内存字节数, 是否为峰值)。Linux 下读取当前常驻内存；没有 /proc 的平台只能拿到进程的峰值常驻内存，
+    峰值只增不减，不能用来判断内存是否持续增长。
+    """
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE"), False
+    except (OSError, ValueError):
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss 在 macOS 上以字节为单位，在 Linux / BSD 上以 KB 为单位
+        return (max_rss if sys.platform == "darwin" else max_rss * 1024), True
+
+
+def open_fds():
+    try:
+        return len(os.listdir("/proc/self/fd"))
+    except OSError:
+        return None
+
+
+async def soak(args):
+    rng = random.Random(args.seed)
+    client = FakeClient(token_delay=args.token_delay)
+    context_policy = ContextPolicy(last_messages=10, max_prompt_tokens=4000)
+
+    # 显式设置默认执行器，以其 max_workers 作为线程数基线：执行器线程随负载逐步启动属于正常现象，不算泄漏
+    max_workers = min(32, (os.cpu_count() or 1) + 4)
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    asyncio.get_running_loop().set_default_executor(executor)
+    thread_baseline = threading.active_count() + max_workers
+    rss_is_peak = rss_bytes()[1]
+    rss_key = "peak_rss_mb" if rss_is_peak else "rss_mb"
+
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        assistant = await create_assistant(OpenAIAssistant(client=client))
+
+    # 结果和延迟都按注入的故障类型（或 healthy）分别统计，避免把连带影响误认为注入的故障
+    kinds = ["healthy"] + FAULTS
+    outcomes = {kind: {} for kind in kinds}
+    samples = []
+    window = {kind: {"first_token": [], "duration": []} for kind in kinds}
+    all_durations = {kind: [] for kind in kinds}
+    window_healthy_timeouts = 0
+    started = time.perf_counter()
+    next_index = 0
+    finished = 0
+
+    def take_sample():
+        nonlocal window_healthy_timeouts
+        gc.collect()
+        sample = {
+            "conversations": finished,
+            "elapsed_s": round(time.perf_counter() - started, 2),
+            rss_key: round(rss_bytes()[0] / 1024 / 1024, 1),
+            "open_fds": open_fds(),
+            "open_tasks": len(asyncio.all_tasks()),
+            "threads": threading.active_count(),
+            # 超出“启动时的线程 + 执行器满员”的线程，才说明有 exec 线程等被遗留
+            "extra_threads": max(0, threading.active_count() - thread_baseline),
+            "live_streams": len(client.live_streams),
+            "unclosed_streams": client.unclosed_streams,
+            "tool_instances": len(server.utils.tool_instances),
+            "tracked_threads": len(context_policy.usage),
+            "healthy_timeouts": window_healthy_timeouts,
+            "healthy_p50_first_token_ms": percentile(window["healthy"]["first_token"], 50),
+        }
+        for kind in kinds:
+            sample[f"{kind}_p95_ms"] = percentile(window[kind]["duration"], 95)
+        samples.append(sample)
+        for kind in kinds:
+            window[kind]["first_token"].clear()
+            window[kind]["duration"].clear()
+        window_healthy_timeouts = 0
+
+    async def run_conversation():
+        nonlocal window_healthy_timeouts
+        fault = None
+        if rng.random() < args.fault_rate:
+            fault = rng.choice(FAULTS)
+        kind = fault or "healthy"
+        thread = await create_thread(client=client)
+        client.scenarios[thread.id] = build_scenario(thread.id, fault, args, rng)
+        gen = chat_with_assistant(assistant=assistant, thread=thread, user_query="分析一下数据",
+                                  client=client, context_policy=context_policy)
+        start = time.perf_counter()
+        first_token = None
+
+        async def consume():
+            nonlocal first_token
+            n_tokens = 0
+            async for _ in gen:
+                if first_token is None:
+                    first_token = (time.perf_counter() - start) * 1000
+                n_tokens += 1
+                if fault == "slow_consumer":
+                    await asyncio.sleep(args.slow_delay)
+                # 模拟客户端中途断开：像普通的 async for 一样直接 break，不显式关闭生成器
+                if fault == "disconnect" and n_tokens >= args.tokens // 2:
+                    break
+
+        try:
+            await asyncio.wait_for(consume(), timeout=args.timeout)
+            outcome = "disconnected" if fault == "disconnect" else "completed"
+        except asyncio.TimeoutError:
+            outcome = "timeout"
+        except Exception:
+            outcome = "failed"
+        finally:
+            if args.close_generators:
+                await gen.aclose()
+            client.scenarios.pop(thread.id, None)
+            delete_thread(thread_id=thread.id, sync_client=client, context_policy=context_policy)
+
+        outcomes[kind][outcome] = outcomes[kind].get(outcome, 0) + 1
+        if kind == "healthy" and outcome == "timeout":
+            window_healthy_timeouts += 1
+        duration = (time.perf_counter() - start) * 1000
+        if outcome == "completed":
+            window[kind]["duration"].append(duration)
+            all_durations[kind].append(duration)
+            if first_token is not None:
+                window[kind]["first_token"].append(first_token)
+
+    async def worker():
+        nonlocal next_index, finished
+        while next_index < args.conversations:
+            next_index += 1
+            await run_conversation()
+            finished += 1
+            if finished % args.sample_every == 0:
+                take_sample()
+
+    take_sample()
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    if samples[-1]["conversations"] != finished:
+        take_sample()
+
+    first, last = samples[0], samples[-1]
+    # 峰值内存只增不减，不计入增长
+    growth_keys = ([] if rss_is_peak else ["rss_mb"]) + ["open_fds", "open_tasks", "extra_threads", "live_streams",
+                                                         "unclosed_streams", "tool_instances", "tracked_threads"]
+    return {
+        "config": {**vars(args), "executor_max_workers": max_workers, "thread_baseline": thread_baseline},
+        "outcomes": outcomes,
+        "latency_ms": {kind: {"p50": percentile(all_durations[kind], 50), "p95": percentile(all_durations[kind], 95),
+                              "p99": percentile(all_durations[kind], 99)} for kind in kinds},
+        "growth": {key: (last[key] - first[key]) if last[key] is not None else None for key in growth_keys},
+        "samples": samples,
+    }
+
+
+def print_report(report):
+    columns = list(report["samples"][0].keys())
+    print("\t".join(columns))
+    for sample in report["samples"]:
+        print("\t".join("-" if sample[column] is None else
+                        (f"{sample[column]:.1f}" if isinstance(sample[column], float) else str(sample[column]))
+                        for column in columns))
+    print("\noutcomes and latency (ms) of completed conversations by injected fault:")
+    for kind, outcomes in report["outcomes"].items():
+        print(f"  {kind}: {outcomes} {report['latency_ms'][kind]}")
+    print(f"growth from first to last sample: {report['growth']}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Soak test chat_with_assistant against a local fake event source.")
+    parser.add_argument("--conversations", type=int, default=2000, help="number of simulated conversations")
+    parser.add_argument("--concurrency", type=int, default=50, help="number of concurrent conversations")
+    parser.add_argument("--tokens", type=int, default=20, help="text deltas per assistant reply")
+    parser.add_argument("--token-delay", type=float, default=0.001, help="seconds between streamed events")
+    parser.add_argument("--fault-rate", type=float, default=0.2, help="fraction of conversations with a fault")
+    parser.add_argument("--tool-rate", type=float, default=0.3, help="fraction of healthy conversations calling a tool")
+    parser.add_argument("--slow-delay", type=float, default=0.01, help="seconds a slow consumer waits per token")
+    parser.add_argument("--timeout", type=float, default=1.0, help="per-conversation timeout in seconds")
+    parser.add_argument("--sample-every", type=int, default=100, help="conversations between resource samples")
+    parser.add_argument("--close-generators", action="store_true",
+                        help="aclose() the chat generator after every conversation")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--report", help="optional path to write the JSON report")
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    # 需要在项目根目录下运行：python -m test.soak_test --conversations 2000
+    args = parse_args()
+    report = asyncio.run(soak(args))
+    print_report(report)
+    if args.report:
+        with open(args.report, "w") as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
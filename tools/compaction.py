@@ -0,0 +1,305 @@
+import re
+import threading
+from functools import lru_cache
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Any, List, Optional, Tuple
+
+try:
+    import tiktoken
+except ImportError:  # tiktoken 为可选依赖，未安装时按字符数估算 token
+    tiktoken = None
+
+
+@lru_cache(maxsize=1)
+def _get_encoding():
+    # 编码只加载一次；tiktoken 未安装或编码文件无法加载时返回 None，退回到估算
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.get_encoding("o200k_base")
+    except Exception:
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """
+    统计文本的 token 数。安装了 tiktoken 时使用 o200k_base 编码精确计算，否则按约 4 个字符一个 token 估算。
+
+    :param text: 要统计的文本。
+    :return: token 数量。
+    """
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text))
+    return (len(text) + 3) // 4
+
+
+@dataclass
+class CompactionStats:
+    """单次工具结果压缩前后的字节数与 token 数。"""
+    original_bytes: int
+    compacted_bytes: int
+    original_tokens: int
+    compacted_tokens: int
+
+    @property
+    def saved_bytes(self) -> int:
+        return self.original_bytes - self.compacted_bytes
+
+    @property
+    def saved_tokens(self) -> int:
+        return self.original_tokens - self.compacted_tokens
+
+
+class BaseCompactor(ABC):
+    """
+    压缩器基类。compact 接收工具的原始结果（可能是任意 Python 对象，也可能是字符串），
+    返回压缩后的结果；不适用时原样返回。text_level 为 True 的压缩器只处理字符串，流水线会在它之前把结果转为字符串；
+    error_only 为 True 的压缩器只用于工具执行出错时的输出，不会改写正常的运行结果。
+    """
+
+    text_level = False
+    error_only = False
+
+    @abstractmethod
+    def compact(self, result: Any) -> Any:
+        """Compact a tool result, or return it unchanged if not applicable."""
+        raise NotImplementedError("Subclasses must implement 'compact' method")
+
+
+class TabularCompactor(BaseCompactor):
+    """
+    将 DataFrame 等表格对象概括为形状、列类型以及首尾若干行，避免把完整的 repr 发送给模型。
+    通过鸭子类型识别（具有 shape、dtypes、head、tail），因此不强制依赖 pandas。
+    """
+
+    def __init__(self, head_rows: int = 5, tail_rows: int = 5):
+        self.head_rows = head_rows
+        self.tail_rows = tail_rows
+
+    def compact(self, result: Any) -> Any:
+        if not all(hasattr(result, attr) for attr in ("shape", "dtypes", "head", "tail")):
+            return result
+
+        shape = tuple(result.shape)
+        n_rows = shape[0] if shape else 0
+        # 行数不多时完整展示即可
+        if n_rows <= self.head_rows + self.tail_rows:
+            return result
+
+        dtypes = result.dtypes
+        if hasattr(dtypes, "items"):
+            dtype_lines = [f"  {name}: {dtype}" for name, dtype in dtypes.items()]
+        else:
+            # Series 的 dtypes 是单个 dtype
+            dtype_lines = [f"  {dtypes}"]
+
+        lines = [
+            f"{type(result).__name__} shape={shape}",
+            "dtypes:",
+            *dtype_lines,
+            f"first {self.head_rows} rows:",
+            str(result.head(self.head_rows)),
+            f"last {self.tail_rows} rows:",
+            str(result.tail(self.tail_rows)),
+        ]
+        return "\n".join(lines)
+
+
+class SequenceCompactor(BaseCompactor):
+    """长列表 / 元组（包括字典中作为值的长列表 / 元组）只保留首尾若干元素，并注明总长度。"""
+
+    def __init__(self, max_items: int = 20, edge_items: int = 5):
+        self.max_items = max_items
+        self.edge_items = edge_items
+
+    def compact(self, result: Any) -> Any:
+        if isinstance(result, dict):
+            if not any(self._is_long(value) for value in result.values()):
+                return result
+            items = ", ".join(f"{key!r}: {self._format(value)}" for key, value in result.items())
+            return f"{{{items}}}"
+
+        if not self._is_long(result):
+            return result
+        return self._format(result)
+
+    def _is_long(self, value: Any) -> bool:
+        return isinstance(value, (list, tuple)) and len(value) > self.max_items
+
+    def _format(self, value: Any) -> str:
+        if not self._is_long(value):
+            return repr(value)
+
+        head = ", ".join(repr(item) for item in value[:self.edge_items])
+        tail = ", ".join(repr(item) for item in value[-self.edge_items:])
+        omitted = len(value) - 2 * self.edge_items
+        open_bracket, close_bracket = ("[", "]") if isinstance(value, list) else ("(", ")")
+        return (f"{open_bracket}{head}, ... <{omitted} items omitted> ..., {tail}{close_bracket} "
+                f"(len={len(value)})")
+
+
+class RepeatedLineCompactor(BaseCompactor):
+    """将连续重复的非空行折叠为一行，并注明重复次数；空行保持原样。"""
+
+    text_level = True
+
+    def __init__(self, min_repeats: int = 4):
+        self.min_repeats = min_repeats
+
+    def compact(self, result: Any) -> Any:
+        if not isinstance(result, str):
+            return result
+
+        compacted = []
+        previous, count = None, 0
+        for line in result.splitlines() + [None]:
+            if line == previous:
+                count += 1
+                continue
+            if previous is not None:
+                if count >= self.min_repeats and previous.strip():
+                    compacted.append(f"{previous}  [repeated {count} times]")
+                else:
+                    compacted.extend([previous] * count)
+            previous, count = line, 1
+        return "\n".join(compacted)
+
+
+class TracebackCompactor(BaseCompactor):
+    """
+    截断 Python traceback：保留用户代码（<string>）所在的帧以及用户代码之后最内层的若干帧，
+    中间的库内部帧用一行省略说明代替，最后的异常信息始终保留。
+    """
+
+    text_level = True
+    error_only = True
+    TRACEBACK_HEADER = "Traceback (most recent call last):"
+    # 标题必须独占一行的开头，避免误伤正文中恰好包含这句话的文本
+    HEADER_PATTERN = re.compile(r"^Traceback \(most recent call last\):.*$", re.MULTILINE)
+    FRAME_PATTERN = re.compile(r'^\s*File "(?P<filename>[^"]+)", line \d+')
+
+    def __init__(self, keep_last_frames: int = 2):
+        self.keep_last_frames = keep_last_frames
+
+    def compact(self, result: Any) -> Any:
+        if not isinstance(result, str):
+            return result
+        header = self.HEADER_PATTERN.search(result)
+        if header is None:
+            return result
+
+        before, header_line = result[:header.start()], header.group(0)
+        frames, tail = self._split_frames(result[header.end():].splitlines()[1:])
+        if not frames:
+            return result
+
+        filenames = [self.FRAME_PATTERN.match(frame[0]).group("filename") for frame in frames]
+        # 最后一个用户代码帧之后的帧才可能是“最内层帧”，之前的都是调用用户代码的框架帧
+        last_user_frame = max((index for index, filename in enumerate(filenames) if filename == "<string>"),
+                              default=-1)
+
+        kept_lines = []
+        omitted = 0
+        for index, frame in enumerate(frames):
+            is_last = index > last_user_frame and index >= len(frames) - self.keep_last_frames
+            if is_last or filenames[index] == "<string>":
+                if omitted:
+                    kept_lines.append(f"  ... <{omitted} frames omitted> ...")
+                    omitted = 0
+                kept_lines.extend(frame)
+            else:
+                omitted += 1
+
+        if omitted:
+            kept_lines.append(f"  ... <{omitted} frames omitted> ...")
+        return "\n".join([before + header_line, *kept_lines, *tail])
+
+    def _split_frames(self, lines: List[str]) -> Tuple[List[List[str]], List[str]]:
+        # 每一帧以 'File "...", line N' 开头，后面跟若干行源码；第一个非缩进行起是异常信息
+        frames, tail = [], []
+        for position, line in enumerate(lines):
+            if self.FRAME_PATTERN.match(line):
+                frames.append([line])
+            elif line.startswith(" ") and frames:
+                frames[-1].append(line)
+            else:
+                tail = lines[position:]
+                break
+        return frames, tail
+
+
+class ToolOutputCompactor:
+    """
+    工具结果压缩流水线：先对原始对象执行对象级压缩（表格、长序列），再转为字符串执行文本级压缩
+    （traceback、重复行），并统计每次调用节省的字节数和 token 数。
+    """
+
+    def __init__(self, compactors: Optional[List[BaseCompactor]] = None, logger=None):
+        """
+        :param compactors: 按顺序执行的压缩器列表，默认使用全部内置压缩器。
+        :param logger: 可选的日志对象，用于记录每次压缩的统计信息。
+        """
+        if compactors is None:
+            compactors = [TabularCompactor(), SequenceCompactor(), TracebackCompactor(), RepeatedLineCompactor()]
+        self.compactors = compactors
+        self.logger = logger
+        # 累计统计，便于观察整体的节省效果；compact 可能在执行器线程中并发调用，用锁保护
+        self._lock = threading.Lock()
+        self.total_calls = 0
+        self.total_saved_bytes = 0
+        self.total_saved_tokens = 0
+
+    def compact(self, result: Any, is_error: bool = False) -> Tuple[str, CompactionStats]:
+        """
+        压缩工具结果并返回最终提交给模型的字符串及其统计信息。
+        文本级压缩没有让结果变小、或压缩失败时，返回原始结果的字符串形式。
+        对象级压缩（表格、长序列）生效时始终采用其概括：str(result) 可能已被 pandas 按 display.max_rows 截断，
+        并不代表完整内容，此时统计中的节省量可能为负。
+
+        :param result: 工具的原始结果。
+        :param is_error: 是否为工具执行出错时的输出，只有出错输出才会执行 error_only 的压缩器（如 traceback 截断）。
+        :return: (压缩后的字符串, CompactionStats)
+        """
+        original = str(result)
+        object_compacted = False
+        try:
+            compacted = result
+            for compactor in self.compactors:
+                if compactor.error_only and not is_error:
+                    continue
+                if compactor.text_level and not isinstance(compacted, str):
+                    compacted = str(compacted)
+                output = compactor.compact(compacted)
+                if not compactor.text_level and output is not compacted:
+                    object_compacted = True
+                compacted = output
+            compacted = str(compacted)
+        except Exception:
+            if self.logger:
+                self.logger.exception("error while compacting tool output, submitting it unchanged")
+            compacted, object_compacted = original, False
+
+        original_bytes = len(original.encode("utf-8"))
+        compacted_bytes = len(compacted.encode("utf-8"))
+        if compacted_bytes >= original_bytes and not object_compacted:
+            compacted, compacted_bytes = original, original_bytes
+
+        original_tokens = count_tokens(original)
+        stats = CompactionStats(
+            original_bytes=original_bytes,
+            compacted_bytes=compacted_bytes,
+            original_tokens=original_tokens,
+            # 未压缩时无需再次分词
+            compacted_tokens=original_tokens if compacted is original else count_tokens(compacted),
+        )
+        with self._lock:
+            self.total_calls += 1
+            self.total_saved_bytes += stats.saved_bytes
+            self.total_saved_tokens += stats.saved_tokens
+
+        if self.logger:
+            self.logger.info(f"compacted tool output: {stats.original_bytes} -> {stats.compacted_bytes} bytes, "
+                             f"{stats.original_tokens} -> {stats.compacted_tokens} tokens")
+        return compacted, stats
@@ -1,7 +1,10 @@
 import asyncio
+import traceback
+from functools import partial
 from pydantic import BaseModel
 from typing import Type
 from tools.base_tool import BaseTool
+from tools.compaction import ToolOutputCompactor
 
 
 class PythonInterpreterInput(BaseModel):
@@ -13,9 +16,11 @@ class PythonInterpreterTool(BaseTool):
     description: str = "Executes Python code and returns the result or error message."
     args_schema: Type[BaseModel] = PythonInterpreterInput
 
-    def __init__(self, logger=None):
+    def __init__(self, logger=None, compactor=None):
         super().__init__()
         self.logger = logger
+        # 结果压缩器：在结果提交给模型之前，对 DataFrame、长列表、traceback 等进行概括
+        self.compactor = compactor or ToolOutputCompactor(logger=logger)
 
     @staticmethod
     def get_name():
@@ -32,7 +37,7 @@ class PythonInterpreterTool(BaseTool):
     def run(self, py_code: str) -> str:
         try:
             # 尝试如果是表达式，则返回表达式运行结果
-            return str(eval(py_code))
+            result = eval(py_code)
         except Exception as e:
             # 如果 eval 失败，则尝试执行 exec
             try:
@@ -41,7 +46,12 @@ class PythonInterpreterTool(BaseTool):
             except Exception as exec_error:
                 if self.logger:
                     self.logger.error(f"Error while executing code: {exec_error}")
-                return f"代码执行时报错: {exec_error}"
+                # 返回完整的 traceback（不含 eval 失败的异常链），由压缩器保留用户代码所在的帧
+                error_traceback = "".join(traceback.format_exception(exec_error, chain=False))
+                return self.compactor.compact(f"代码执行时报错:\n{error_traceback}", is_error=True)[0]
+
+        # 压缩放在 try 之外，避免压缩出错时误走 exec 分支而重复执行代码
+        return self.compactor.compact(result)[0]
 
     async def arun(self, py_code: str) -> str:
         """
@@ -54,8 +64,6 @@ class PythonInterpreterTool(BaseTool):
         try:
             # 将 eval 运行在执行器中，以便异步运行
             result = await loop.run_in_executor(None, eval, py_code)
-            return str(result)
-
         except Exception as e:
             # 如果 eval 失败，尝试执行 exec
             try:
@@ -64,4 +72,11 @@ class PythonInterpreterTool(BaseTool):
             except Exception as exec_error:
                 if self.logger:
                     self.logger.error(f"Error while executing code: {exec_error}")
-                return f"代码执行时报错: {exec_error}"
+                # 返回完整的 traceback（不含 eval 失败的异常链），由压缩器保留用户代码所在的帧
+                error_traceback = "".join(traceback.format_exception(exec_error, chain=False))
+                compact = partial(self.compactor.compact, f"代码执行时报错:\n{error_traceback}", is_error=True)
+                return (await loop.run_in_executor(None, compact))[0]
+
+        # 压缩放在 try 之外，避免压缩出错时误走 exec 分支而重复执行代码；
+        # 结果的字符串化和分词可能很耗时，同样放到执行器中，避免阻塞事件循环上的其他流
+        return (await loop.run_in_executor(None, self.compactor.compact, result))[0]